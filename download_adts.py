@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""Download a continent's root ADT files from wago.tools.
+
+wago.tools serves classic-era CASC content by file data ID, which gets us the
+.adt files without having to parse the CASC archives ourselves (see README).
+File data IDs come from a community listfile (https://github.com/wowdev/wow-listfile),
+passed with --listfile as the usual "<id>;<path>" CSV.
+
+Run directly this fetches Azeroth into azeroth_adts/;
+download_kalimdor_adts.py wraps main() for Kalimdor.
+
+Downloads run concurrently on asyncio + httpx with HTTP/2, so all in-flight
+requests multiplex over a handful of TLS connections; a semaphore bounds the
+number of streams so we stay polite to wago.tools.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import aiofiles
+import httpx
+
+WAGO_HOST = "wago.tools"
+WAGO_URL = "https://" + WAGO_HOST + "/api/casc/{file_id}?download"
+
+# Advertise brotli only when the decoder is importable; httpx decompresses
+# whatever it negotiated transparently while streaming.
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip"
+
+# Progress bar is cosmetic; fall back to a quiet run without it.
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+log = logging.getLogger("download_adts")
+
+
+def parse_listfile(listfile_path, continent):
+    """Return (file_id, filename) pairs for the continent's .adt entries."""
+    # Community listfiles run to a million-plus lines, so read the whole
+    # file and split at C level rather than iterating Python line objects,
+    # and reject non-ADT lines before paying for the per-line .lower().
+    prefix = "world/maps/%s/" % continent
+    with open(listfile_path, encoding="utf-8", errors="replace") as f:
+        data = f.read()
+    wanted = []
+    append = wanted.append
+    for line in data.splitlines():
+        semi = line.find(";")
+        if semi < 0:
+            continue
+        raw = line[semi + 1:]
+        if ".adt" not in raw and ".ADT" not in raw:
+            continue
+        path = raw.strip().lower()
+        if path.startswith(prefix) and path.endswith(".adt"):
+            try:
+                append((int(line[:semi]), path.rsplit("/", 1)[-1]))
+            except ValueError:
+                continue
+    return wanted
+
+
+@lru_cache(maxsize=None)
+def adt_name_re(continent):
+    """Compiled pattern for the continent's root tiles, e.g. azeroth_32_48.adt.
+
+    The _tex0/_obj0/_lod variants don't match. Cached so the compile runs
+    once per continent, not per response.
+    """
+    return re.compile(r"%s_\d+_\d+\.adt" % continent)
+
+# One alternation covering the RFC 5987 filename*=, quoted, and bare forms
+# so the header is scanned once instead of once per form.
+_CD_RE = re.compile(
+    r"""filename\*\s*=\s*(?:UTF-8'')?(?P<star>[^;]+)
+        |filename\s*=\s*"(?P<quoted>[^"]+)"
+        |filename\s*=\s*(?P<bare>[^;\s]+)""",
+    re.IGNORECASE | re.VERBOSE)
+
+
+def filename_from_content_disposition(value):
+    """Pull the filename out of a Content-Disposition header, if any."""
+    if not value:
+        return None
+    m = _CD_RE.search(value)
+    if not m:
+        return None
+    name = m.group("star") or m.group("quoted") or m.group("bare")
+    return name.strip().strip('"')
+
+
+def is_root_adt_name(name, continent):
+    """True for the continent's root tiles (not _tex0/_obj0/_lod)."""
+    return adt_name_re(continent).fullmatch(name.lower()) is not None
+
+
+def drop_page_cache(fd):
+    """Hint the kernel to evict this file's pages from the page cache.
+
+    Nothing in this script reads a downloaded ADT back, so there is no
+    point keeping gigabytes of tile data cached at the expense of hotter
+    pages. DONTNEED only drops clean pages, so flush them to disk first.
+    No-op on platforms without posix_fadvise.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    os.fsync(fd)
+    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def file_size(path):
+    """Size of path in bytes, or 0 if it doesn't exist."""
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+async def probe_headers(client, url):
+    """Fetch just the response headers for url, without the body.
+
+    Tries HEAD first and falls back to a one-byte Range GET for servers
+    that reject HEAD. Returns None when the probe fails; the caller should
+    fall through to the full download rather than trust a failed probe.
+    """
+    try:
+        resp = await client.head(url)
+        if resp.status_code == 200:
+            return resp.headers
+        async with client.stream("GET", url, headers={"Range": "bytes=0-0"}) as resp:
+            if resp.status_code in (200, 206):
+                return resp.headers
+    except httpx.HTTPError:
+        pass
+    return None
+
+
+# Statuses worth retrying, same set urllib3.Retry uses for its
+# status_forcelist: rate limiting plus transient server errors.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def retry_delay_s(attempt, backoff_base_s, retry_after=None):
+    """Seconds to sleep before the given (1-based) retry attempt.
+
+    Honors a numeric Retry-After when the server sent one; otherwise uses
+    AWS-style full-jitter exponential backoff so concurrent workers don't
+    retry in lockstep. Capped at 60 s either way.
+    """
+    if retry_after:
+        try:
+            return min(60.0, float(retry_after))
+        except ValueError:
+            pass  # HTTP-date form; fall through to the normal backoff
+    return random.uniform(0, min(60.0, backoff_base_s * (2 ** (attempt - 1))))
+
+
+async def http_download(client, url, dest, headers=None, retries=3, backoff_base_s=1.0,
+                        executor=None):
+    """GET url, streaming the body into dest. Returns (headers, status).
+
+    The body never sits in memory: it is written to dest in 1 MiB chunks
+    as it arrives, truncating on 200 and appending on 206. A 416 means the
+    requested range starts at EOF (dest already holds the whole file). Any
+    Range header is re-derived from dest's size before each attempt so a
+    retry after a partial write never appends duplicate bytes. Network
+    errors and retryable statuses (429/5xx) are retried with full-jitter
+    exponential backoff; anything else fails immediately.
+    """
+    last_exc = None
+    for attempt in range(1, retries + 1):
+        retry_after = None
+        if headers and "Range" in headers:
+            headers["Range"] = "bytes=%d-" % await asyncio.to_thread(file_size, dest)
+            # Range offsets only line up with the bytes already on disk if
+            # the server doesn't compress the suffix.
+            headers["Accept-Encoding"] = "identity"
+        try:
+            async with client.stream("GET", url, headers=headers) as resp:
+                if resp.status_code in (200, 206):
+                    mode = "ab" if resp.status_code == 206 else "wb"
+                    # Unbuffered: each chunk goes straight to write(2)
+                    # instead of through Python's buffered-writer copy.
+                    async with aiofiles.open(dest, mode, buffering=0,
+                                             executor=executor) as f:
+                        async for chunk in resp.aiter_bytes(1 << 20):
+                            await f.write(chunk)
+                        # aiofiles proxies fileno() synchronously; it
+                        # returns the int directly, not an awaitable.
+                        await asyncio.to_thread(drop_page_cache, f.fileno())
+                    return resp.headers, resp.status_code
+                if resp.status_code == 416:
+                    return resp.headers, resp.status_code
+                if resp.status_code not in RETRY_STATUSES:
+                    raise RuntimeError("HTTP %d for %s" % (resp.status_code, url))
+                last_exc = RuntimeError("HTTP %d for %s" % (resp.status_code, url))
+                retry_after = resp.headers.get("Retry-After")
+        except httpx.RemoteProtocolError as exc:
+            # The server dropped a pooled keep-alive connection while it sat
+            # idle; the pool replaces it on the next attempt, so retry right
+            # away instead of backing off.
+            last_exc = exc
+            continue
+        except httpx.TransportError as exc:
+            last_exc = exc
+        if attempt < retries:
+            await asyncio.sleep(retry_delay_s(attempt, backoff_base_s, retry_after))
+    raise RuntimeError("download failed after %d attempts: %s" % (retries, url)) from last_exc
+
+
+def parse_args(continent):
+    parser = argparse.ArgumentParser(
+        description="Download %s root ADT files from wago.tools" % continent.capitalize())
+    parser.add_argument("--listfile", default="listfile.csv",
+                        help="community listfile mapping file data IDs to paths")
+    parser.add_argument("--outdir", default=continent + "_adts",
+                        help="directory to write .adt files into")
+    parser.add_argument("--concurrency", type=int, default=64,
+                        help="max concurrent streams in flight at once")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="per-request timeout in seconds")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="attempts per file before giving up")
+    parser.add_argument("--backoff", type=float, default=1.0,
+                        help="base seconds for the retry backoff")
+    parser.add_argument("--verbose", action="store_true",
+                        help="log every downloaded file, not just problems")
+    return parser.parse_args()
+
+
+async def main(continent="azeroth"):
+    args = parse_args(continent)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.WARNING,
+        format="%(levelname)s %(message)s")
+
+    listfile = Path(args.listfile)
+    if not listfile.exists():
+        print("listfile not found: %s" % listfile, file=sys.stderr)
+        return 1
+
+    ids = parse_listfile(listfile, continent)
+    if not ids:
+        print("no %s .adt entries found in %s" % (continent, listfile), file=sys.stderr)
+        return 1
+
+    outdir = Path(args.outdir)
+    outdir.mkdir(exist_ok=True)
+
+    # Decide everything we can before touching the network: listfiles can
+    # repeat IDs, the manifest name already tells us which entries are
+    # _tex0/_obj0/_lod variants, and files from earlier runs are done.
+    seen_ids = set()
+    todo = []
+    pre_skipped = 0
+    already_present = 0
+    for fid, name in ids:
+        if fid in seen_ids:
+            continue
+        seen_ids.add(fid)
+        if not is_root_adt_name(name, continent):
+            pre_skipped += 1
+            continue
+        if file_size(outdir / name) > 0:
+            already_present += 1
+            continue
+        todo.append((fid, name))
+
+    # Ascending file IDs tend to be adjacent in the CDN's storage, which
+    # helps cache locality on the far end.
+    todo.sort()
+
+    print("Found %d %s ADT entries: %d to download, %d already present, %d non-root"
+          % (len(ids), continent, len(todo), already_present, pre_skipped))
+    if not todo:
+        print("Nothing to do")
+        return 0
+
+    downloaded = 0
+    skipped = 0
+    failed = 0
+
+    # Resolve the host once up front. This warms the resolver cache for
+    # the pooled connections and fails fast with one clear message when
+    # DNS is broken, rather than a retry-wrapped error per download.
+    try:
+        await asyncio.to_thread(socket.getaddrinfo, WAGO_HOST, 443)
+    except OSError as exc:
+        print("cannot resolve %s: %s" % (WAGO_HOST, exc), file=sys.stderr)
+        return 1
+
+    sem = asyncio.Semaphore(args.concurrency)
+    # A handful of HTTP/2 connections carries every concurrent stream, so
+    # one TLS handshake per connection amortizes over the whole run.
+    limits = httpx.Limits(max_connections=4, max_keepalive_connections=4)
+    # Dedicated pool for disk I/O so writes drain off the event loop while
+    # the network side keeps receiving.
+    write_pool = ThreadPoolExecutor(
+        max_workers=min(32, (os.cpu_count() or 4) * 4),
+        thread_name_prefix="adt-write")
+
+    async with httpx.AsyncClient(http2=True, timeout=args.timeout, limits=limits,
+                                 follow_redirects=True,
+                                 headers={"Accept-Encoding": ACCEPT_ENCODING}) as client:
+
+        async def worker(file_id, listfile_name):
+            nonlocal downloaded, skipped, failed
+            async with sem:
+                url = WAGO_URL.format(file_id=file_id)
+
+                # Cheap header probe first: if the server's filename says
+                # this ID is a _tex0/_obj0/_lod variant, skip it without
+                # transferring the body at all.
+                probed_name = None
+                probe_hdrs = await probe_headers(client, url)
+                if probe_hdrs is not None:
+                    probed_name = filename_from_content_disposition(
+                        probe_hdrs.get("Content-Disposition"))
+                    if probed_name and not is_root_adt_name(probed_name, continent):
+                        skipped += 1
+                        return
+
+                # Resume a leftover .part from an earlier run instead of
+                # re-transferring its prefix. The tmp name is keyed by the
+                # listfile name so it is known before the response headers.
+                tmp = outdir / (listfile_name + ".part")
+                resume_from = await asyncio.to_thread(file_size, tmp)
+                req_headers = {"Range": "bytes=%d-" % resume_from} if resume_from else None
+
+                try:
+                    resp_headers, status = await http_download(
+                        client, url, tmp, headers=req_headers,
+                        retries=args.retries, backoff_base_s=args.backoff,
+                        executor=write_pool)
+                except RuntimeError as exc:
+                    log.warning("%s: %s", listfile_name, exc)
+                    failed += 1
+                    return
+
+                # The probe already parsed the server's filename; only fall
+                # back to the download response when the probe failed.
+                server_name = probed_name or filename_from_content_disposition(
+                    resp_headers.get("Content-Disposition")) or listfile_name
+                if not is_root_adt_name(server_name, continent):
+                    # The body already streamed to disk before the name was
+                    # known; don't leave the stray .part behind.
+                    await asyncio.to_thread(tmp.unlink, missing_ok=True)
+                    skipped += 1
+                    return
+
+                if status == 416 and resume_from:
+                    # The range starts at EOF: the .part already holds the
+                    # complete file, only the rename was missed.
+                    await asyncio.to_thread(tmp.rename, outdir / server_name)
+                    downloaded += 1
+                    log.debug("%s (resumed, already complete)", server_name)
+                    return
+
+                if await asyncio.to_thread(file_size, tmp) == 0:
+                    log.warning("%s: empty body", server_name)
+                    failed += 1
+                    return
+
+                await asyncio.to_thread(tmp.rename, outdir / server_name)
+                downloaded += 1
+                log.debug("%s", server_name)
+
+        tasks = [asyncio.create_task(worker(fid, name)) for fid, name in todo]
+        # tqdm batches its redraws, so progress costs a handful of writes
+        # per second instead of a flushed print per download.
+        progress = tqdm(total=len(tasks), desc=continent, unit="file") if tqdm else None
+        try:
+            for fut in asyncio.as_completed(tasks):
+                await fut
+                if progress:
+                    progress.update(1)
+        finally:
+            if progress:
+                progress.close()
+
+    print("Done: %d downloaded, %d skipped, %d failed" % (downloaded, skipped, failed))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
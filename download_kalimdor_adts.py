@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+"""Download the Kalimdor root ADT files from wago.tools into kalimdor_adts/.
+
+Thin wrapper around download_adts; see that module for the options.
+"""
+
+import asyncio
+import sys
+
+import download_adts
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(download_adts.main(continent="kalimdor")))